@@ -5,10 +5,12 @@ __author__ = "G.J.J. van den Burg"
 
 """Tests"""
 
+import contextlib
 import unittest
 import tempfile
 import hashlib
 import shutil
+import sys
 import os
 
 from arxiv2remarkable import (
@@ -22,85 +24,121 @@ from arxiv2remarkable import (
 )
 
 VERBOSE = False
+CACHE_DIR = os.path.join(os.path.expanduser("~"), ".cache", "a2r-tests")
+_needs_net = unittest.skipUnless(
+    os.environ.get("A2R_NET_TESTS"), "network tests disabled"
+)
+LOCAL_PDF_BYTES = b"%PDF-1.1\n%\xc2\xa5\xc2\xb1\xc3\xab\n\n1 0 obj\n  << /Type /Catalog\n     /Pages 2 0 R\n  >>\nendobj\n\n2 0 obj\n  << /Type /Pages\n     /Kids [3 0 R]\n     /Count 1\n     /MediaBox [0 0 300 144]\n  >>\nendobj\n\n3 0 obj\n  <<  /Type /Page\n      /Parent 2 0 R\n      /Resources\n       << /Font\n           << /F1\n               << /Type /Font\n                  /Subtype /Type1\n                  /BaseFont /Times-Roman\n               >>\n           >>\n       >>\n      /Contents 4 0 R\n  >>\nendobj\n\n4 0 obj\n  << /Length 55 >>\nstream\n  BT\n    /F1 18 Tf\n    0 0 Td\n    (Hello World) Tj\n  ET\nendstream\nendobj\n\nxref\n0 5\n0000000000 65535 f \n0000000018 00000 n \n0000000077 00000 n \n0000000178 00000 n \n0000000457 00000 n \ntrailer\n  <<  /Root 1 0 R\n      /Size 5\n  >>\nstartxref\n565\n%%EOF"
 
+if hasattr(contextlib, "chdir"):
+    chdir = contextlib.chdir
+else:
 
-def md5sum(filename):
-    blocksize = 65536
-    hasher = hashlib.md5()
-    with open(filename, "rb") as fid:
-        buf = fid.read(blocksize)
-        while len(buf) > 0:
-            hasher.update(buf)
-            buf = fid.read(blocksize)
-    return hasher.hexdigest()
+    @contextlib.contextmanager
+    def chdir(path):
+        old_dir = os.getcwd()
+        os.chdir(path)
+        try:
+            yield
+        finally:
+            os.chdir(old_dir)
 
 
 class Tests(unittest.TestCase):
     @classmethod
     def setUpClass(cls):
-        cls.original_dir = os.getcwd()
+        cls._root = tempfile.mkdtemp()
+        cls._providers = {}
 
-    def setUp(self):
-        self.test_dir = tempfile.mkdtemp()
-        os.chdir(self.test_dir)
+    @classmethod
+    def tearDownClass(cls):
+        shutil.rmtree(cls._root)
 
-    def tearDown(self):
-        os.chdir(self.original_dir)
-        shutil.rmtree(self.test_dir)
+    def setUp(self):
+        self.test_dir = os.path.join(self._root, self._testMethodName)
+        os.mkdir(self.test_dir)
+
+    def _providerTest(self, provider, url, exp_filename, **kwargs):
+        """ Run provider on url, reusing a cached result if available """
+        key = hashlib.sha256(
+            ("%s|%s" % (provider.__name__, url)).encode()
+        ).hexdigest()
+        cache_dir = os.path.join(CACHE_DIR, key)
+        use_cache = not os.environ.get("A2R_TEST_NOCACHE")
+        if use_cache and os.path.isdir(cache_dir):
+            cached = os.listdir(cache_dir)
+            if len(cached) == 1:
+                filename = shutil.copy(
+                    os.path.join(cache_dir, cached[0]), self.test_dir
+                )
+                self.assertEqual(exp_filename, os.path.basename(filename))
+                return
+        if provider not in self._providers:
+            self._providers[provider] = provider(upload=False, verbose=VERBOSE)
+        prov = self._providers[provider]
+        with chdir(self.test_dir):
+            filename = prov.run(url, **kwargs)
+        self.assertEqual(exp_filename, os.path.basename(filename))
+        shutil.rmtree(cache_dir, ignore_errors=True)
+        os.makedirs(cache_dir)
+        shutil.copy(filename, cache_dir)
 
+    @_needs_net
     def test_arxiv(self):
-        prov = Arxiv(upload=False, verbose=VERBOSE)
         url = "https://arxiv.org/abs/1811.11242v1"
         exp_filename = "Burg_Nazabal_Sutton_-_Wrangling_Messy_CSV_Files_by_Detecting_Row_and_Type_Patterns_2018.pdf"
-        filename = prov.run(url)
-        self.assertEqual(exp_filename, os.path.basename(filename))
+        self._providerTest(Arxiv, url, exp_filename)
 
+    @_needs_net
     def test_pmc(self):
-        prov = Pubmed(upload=False, verbose=VERBOSE)
         url = "https://www.ncbi.nlm.nih.gov/pmc/articles/PMC3474301/"
         exp_filename = (
             "Hoogenboom_Manske_-_How_to_Write_a_Scientific_Article_2012.pdf"
         )
-        filename = prov.run(url)
-        self.assertEqual(exp_filename, os.path.basename(filename))
+        self._providerTest(Pubmed, url, exp_filename)
 
+    @_needs_net
     def test_acm(self):
-        prov = ACM(upload=False, verbose=VERBOSE)
         url = "https://dl.acm.org/citation.cfm?id=3025626"
         exp_filename = "Kery_Horvath_Myers_-_Variolite_Supporting_Exploratory_Programming_by_Data_Scientists_2017.pdf"
-        filename = prov.run(url)
-        self.assertEqual(exp_filename, os.path.basename(filename))
+        self._providerTest(ACM, url, exp_filename)
 
+    @_needs_net
     def test_openreview(self):
-        prov = OpenReview(upload=False, verbose=VERBOSE)
         url = "https://openreview.net/forum?id=S1x4ghC9tQ"
         exp_filename = "Gregor_et_al_-_Temporal_Difference_Variational_Auto-Encoder_2018.pdf"
-        filename = prov.run(url)
-        self.assertEqual(exp_filename, os.path.basename(filename))
+        self._providerTest(OpenReview, url, exp_filename)
 
+    @_needs_net
     def test_springer(self):
-        prov = Springer(upload=False, verbose=VERBOSE)
         url = "https://link.springer.com/article/10.1007/s10618-019-00631-5"
         exp_filename = "Mauw_Ramirez-Cruz_Trujillo-Rasua_-_Robust_Active_Attacks_on_Social_Graphs_2019.pdf"
-        filename = prov.run(url)
-        self.assertEqual(exp_filename, os.path.basename(filename))
+        self._providerTest(Springer, url, exp_filename)
 
     def test_local(self):
         local_filename = "test.pdf"
-        with open(local_filename, "w") as fp:
-            fp.write(
-                "%PDF-1.1\n%¥±ë\n\n1 0 obj\n  << /Type /Catalog\n     /Pages 2 0 R\n  >>\nendobj\n\n2 0 obj\n  << /Type /Pages\n     /Kids [3 0 R]\n     /Count 1\n     /MediaBox [0 0 300 144]\n  >>\nendobj\n\n3 0 obj\n  <<  /Type /Page\n      /Parent 2 0 R\n      /Resources\n       << /Font\n           << /F1\n               << /Type /Font\n                  /Subtype /Type1\n                  /BaseFont /Times-Roman\n               >>\n           >>\n       >>\n      /Contents 4 0 R\n  >>\nendobj\n\n4 0 obj\n  << /Length 55 >>\nstream\n  BT\n    /F1 18 Tf\n    0 0 Td\n    (Hello World) Tj\n  ET\nendstream\nendobj\n\nxref\n0 5\n0000000000 65535 f \n0000000018 00000 n \n0000000077 00000 n \n0000000178 00000 n \n0000000457 00000 n \ntrailer\n  <<  /Root 1 0 R\n      /Size 5\n  >>\nstartxref\n565\n%%EOF"
-            )
+        with open(os.path.join(self.test_dir, local_filename), "wb") as fp:
+            fp.write(LOCAL_PDF_BYTES)
         prov = LocalFile(upload=False, verbose=VERBOSE)
-        filename = prov.run(local_filename)
+        with chdir(self.test_dir):
+            filename = prov.run(local_filename)
         self.assertEqual("test_.pdf", os.path.basename(filename))
 
+    @_needs_net
     def test_pdfurl(self):
-        prov = PdfUrl(upload=False, verbose=VERBOSE)
         url = "http://www.jmlr.org/papers/volume17/14-526/14-526.pdf"
-        filename = prov.run(url, filename="test.pdf")
-        self.assertEqual("test.pdf", os.path.basename(filename))
+        self._providerTest(PdfUrl, url, "test.pdf", filename="test.pdf")
 
 
 if __name__ == "__main__":
-    unittest.main()
+    try:
+        from concurrencytest import ConcurrentTestSuite, fork_for_tests
+    except ImportError:
+        unittest.main()
+    else:
+        # Provider.run() changes the working directory, so run the tests in
+        # forked processes rather than threads.
+        suite = unittest.TestLoader().loadTestsFromTestCase(Tests)
+        runner = unittest.TextTestRunner()
+        result = runner.run(ConcurrentTestSuite(suite, fork_for_tests(6)))
+        sys.exit(not result.wasSuccessful())